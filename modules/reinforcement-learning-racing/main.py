@@ -44,6 +44,10 @@ parser.add_argument('--frame-pack', action = 'store_true', default = False,
                     help = 'stack 4 latest frames as 4 channels (default: False)')
 parser.add_argument('--frame-buffer', action = 'store_true', default = False,
                     help = 'no window will be displayed (default: False)')
+parser.add_argument('--frame-cache', action = 'store_true', default = False,
+                    help = 'reuse frames rendered from a close sprite pose (default: False)')
+parser.add_argument('--render-skip', type = int, default = 1, metavar = 'RS',
+                    help = 'repeat each agent action for a number of steps, rendering once (default: 1)')
 parser.add_argument('--frame-grayscale', action = 'store_true', default = False,
                     help = 'use grayscale image samples (default: False)')
 
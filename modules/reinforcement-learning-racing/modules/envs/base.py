@@ -20,10 +20,11 @@ class BaseEnv:
 
     frame_size = None
     frame_shape = None
+    frame_dtype = None
 
-    def __init__(self, device, frame_shape, frame_diff = False, frame_pack = False):
+    def __init__(self, device, frame_shape, frame_diff = False, frame_pack = False, frame_dtype = torch.float32):
 
-        self.device = device
+        self.device, self.frame_dtype = device, frame_dtype
         self.frame_shape = np.array(frame_shape)
         if self.frame_shape[0] % 4 == 0:
             self.frame_shape[0] /= 4
@@ -36,7 +37,7 @@ class BaseEnv:
 
     def states_fill(self):
         for i in range(self.states.maxlen):
-            self.states.append(torch.zeros(tuple(self.frame_shape)).to(self.device))
+            self.states.append(torch.zeros(tuple(self.frame_shape), dtype = self.frame_dtype).to(self.device))
 
     def init(self):
         raise NotImplementedError
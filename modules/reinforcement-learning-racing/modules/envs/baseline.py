@@ -1,10 +1,9 @@
+import cv2
 import gym
 import numpy as np
 import torch
-import torchvision.transforms as transforms
 
 from modules.envs import BaseEnv
-from PIL import Image
 
 
 class Baseline(BaseEnv):
@@ -14,6 +13,9 @@ class Baseline(BaseEnv):
     # This is based on the code from gym.
     screen_width = 600
 
+    # ITU-R 601-2 luma transform, scaled to [0, 1]
+    grayscale_weights = np.array([0.299, 0.587, 0.114], dtype = np.float32) / 255.
+
     # Environment
     env = None
 
@@ -23,12 +25,6 @@ class Baseline(BaseEnv):
     def init(self):
         self.env = gym.make('CartPole-v0').unwrapped
         self.env.reset()
-        self.resizer = transforms.Compose([
-            transforms.ToPILImage(),
-            transforms.Resize(self.frame_size, interpolation = Image.CUBIC),
-            transforms.Grayscale(),
-            transforms.ToTensor()
-        ])
 
     def get_cart_location(self):
         world_width = self.env.x_threshold * 2
@@ -54,12 +50,12 @@ class Baseline(BaseEnv):
         # Strip off the edges, so that we have a square image centered on a cart
         screen = screen[:, :, slice_range]
 
-        # Convert to float, rescale, convert to torch tensor
-        screen = np.ascontiguousarray(screen, dtype = np.float32) / 255
-        screen = torch.from_numpy(screen)
+        # Grayscale and rescale, HxW float32
+        frame = np.tensordot(Baseline.grayscale_weights, screen, axes = 1)
 
-        # Resize, and add a batch dimension (BCHW)
-        frame = self.resizer(screen)
+        # Resize, and add a channel dimension (CHW)
+        frame = cv2.resize(frame, (int(self.frame_size[1]), int(self.frame_size[0])), interpolation = cv2.INTER_AREA)
+        frame = torch.from_numpy(frame).unsqueeze(0)
 
         return self.edit_frame(frame)
 
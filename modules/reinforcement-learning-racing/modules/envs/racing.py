@@ -1,12 +1,15 @@
 import pygame
 import numpy as np
 import os
+import sys
 import torch
 import modules.utils as utils
 
+from collections import OrderedDict
 from PIL import Image
 from modules.envs import BaseEnv
 from modules import Track, Sprite
+from modules.fast_preproc import snapshot_gray
 
 TITLE = "RL racer"
 SIZE = [700, 700]
@@ -15,6 +18,9 @@ FPS_CAP = 60.0
 TRANSPARENT = (0, 0, 0, 0)
 CLEAR_SCREEN = (255, 255, 255)
 
+# ITU-R 601-2 luma transform, as PIL's "L" mode
+GRAYSCALE_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype = np.float32)
+
 
 def get_caption_renderer(window_active, clock = False):
     if clock:
@@ -42,48 +48,84 @@ def create_text_renderer(screen):
     return text_render
 
 
+def surface_pixels(surface):
+    """ Row-major HxWxB view of the surface pixels, no copy, and the byte index of each RGB channel """
+    width, height = surface.get_size()
+    bytesize, pitch = surface.get_bytesize(), surface.get_pitch()
+
+    # The view keeps the surface locked while referenced
+    data = np.frombuffer(surface.get_buffer(), dtype = np.uint8).reshape(height, pitch)[:, :width * bytesize]
+    data = data.reshape(height, width, bytesize)
+
+    channels = [ shift // 8 if sys.byteorder == 'little' else bytesize - 1 - shift // 8
+                 for shift in surface.get_shifts()[:3] ]
+
+    return data, np.array(channels)
+
+
 def create_snapshot(surface, size = None, center = None, offset = None, rotation = None, filename: str = "screen.png",
                     format = "PNG",
                     save = False,
-                    normalize = False, tensor = False, grayscale = False):
-    # Get image data
-    data = pygame.surfarray.pixels3d(surface)
+                    normalize = False, tensor = False, grayscale = False, out_frame = None):
+    # Get image data, a view indexed as (y, x)
+    data, channels = surface_pixels(surface)
+    height, width = data.shape[:2]
+
+    # Sampling grid in screen space, cropped around the center
+    if size is not None and center is not None:
+        lu = np.maximum((center + (offset if offset is not None else 0) - size / 2).astype(int), (0, 0))
+        grid_size = size
+    else:
+        lu, grid_size = np.zeros(2, dtype = int), (width, height)
 
-    # Preprocess the image
-    image = Image.fromarray(np.rollaxis(data, 0, 1)[::-1, :, :], mode = "RGB")
-    image = image.rotate(270)
+    # Rotation of the grid around the center, nearest neighbour as PIL does
     if center is not None and rotation is not None:
-        image = image.rotate(rotation, center = tuple(center.astype(int)))
+        pivot, angle = center.astype(int), np.radians(rotation)
+    else:
+        pivot, angle = np.zeros(2, dtype = int), 0.
 
-    if size is not None and center is not None:
-        if offset is not None:
-            center += offset
+    if tensor and grayscale and not save:
+        # Training frames, a single compiled pass from the surface to the CHW frame, uint8 unless normalized
+        dtype = torch.float32 if normalize else torch.uint8
+        frame = out_frame if out_frame is not None else torch.empty((1, grid_size[1], grid_size[0]), dtype = dtype)
+        snapshot_gray(data, channels, int(lu[0]), int(lu[1]), int(pivot[0]), int(pivot[1]), np.cos(angle),
+                      np.sin(angle), frame.numpy(), 1 / 255. if normalize else 1., 0. if normalize else 0.5)
 
-        lu = np.maximum((center - size / 2).astype(int), (0, 0))
-        rl = lu + size
+        return frame
 
-        image = image.crop(box = (*lu, *rl))
+    # Map the grid back through the rotation
+    xs, ys = np.arange(lu[0], lu[0] + grid_size[0]), np.arange(lu[1], lu[1] + grid_size[1])
+    dx, dy = xs[np.newaxis, :] + 0.5 - pivot[0], ys[:, np.newaxis] + 0.5 - pivot[1]
 
-    if grayscale:
-        image = image.convert(mode = "L")
+    src_x = np.floor(np.cos(angle) * dx - np.sin(angle) * dy + pivot[0]).astype(int)
+    src_y = np.floor(np.sin(angle) * dx + np.cos(angle) * dy + pivot[1]).astype(int)
+
+    # Gather the HxWxC image, grid pixels past the surface (padded by the crop) and sources outside of it are black
+    rows, cols = np.clip(src_y, 0, height - 1)[..., np.newaxis], np.clip(src_x, 0, width - 1)[..., np.newaxis]
+    image = data[rows, cols, channels]
+    image[(src_x < 0) | (src_x >= width) | (src_y < 0) | (src_y >= height) |
+          (xs >= width)[np.newaxis, :] | (ys >= height)[:, np.newaxis]] = 0
 
     if save:
-        image.save("./snapshots/" + filename, format = format)
+        snapshot = Image.fromarray(image, mode = "RGB")
+        if grayscale:
+            snapshot = snapshot.convert(mode = "L")
 
-    raw_image = np.asarray(image)
-    if tensor:
-        raw_image_tensor = torch.from_numpy(raw_image).float()
-        if not grayscale or len(image.getbands()) > 1:
-            raw_image_tensor = raw_image_tensor.transpose(1, 2).transpose(0, 1)
-        else:
-            raw_image_tensor = raw_image_tensor.unsqueeze(dim = 0)
+        snapshot.save("./snapshots/" + filename, format = format)
+
+    if grayscale:
+        # Luminance and normalization in a single pass
+        image = image @ (GRAYSCALE_WEIGHTS / 255. if normalize else GRAYSCALE_WEIGHTS)
+    elif normalize:
+        image = image * np.float32(1 / 255.)
 
-        if normalize:
-            raw_image_tensor = raw_image_tensor / 255.
+    if tensor:
+        if grayscale:
+            return torch.from_numpy(np.ascontiguousarray(image)).unsqueeze(dim = 0)
 
-        return raw_image_tensor
+        return torch.from_numpy(np.ascontiguousarray(image.transpose((2, 0, 1))))
 
-    return raw_image
+    return image
 
 
 def rewarder(params: dict) -> float:
@@ -124,20 +166,33 @@ class Racing(BaseEnv):
 
     ENV_ACTION_SPACE = 5
 
+    FRAME_CACHE_SIZE: int = 10000
+    EVENT_PUMP_EVERY: int = 30
+
     attenuation: float = 1.0
+    event_step: int = 0
 
     agent_active: bool
     frame_buffer: bool
+    frame_cache: bool
+    normalize_on_gpu: bool
+    render_skip: int
 
     track_random_reset: bool
     track_random_reset_every: int
 
     def __init__(self, device, frame_shape, agent_active = True, track_random_reset = False,
                  track_random_reset_every = 6, frame_diff = False, frame_pack = False,
-                 frame_buffer = False, track_cache = True, track_file = None, track_save = False):
-        super().__init__(device, frame_shape, frame_diff, frame_pack)
+                 frame_buffer = False, track_cache = True, track_file = None, track_save = False, frame_cache = False,
+                 normalize_on_gpu = True, render_skip = 1):
+        # Frames are kept as uint8 and normalized by the agent model, differences of frames need a signed type
+        self.normalize_on_gpu = normalize_on_gpu and not frame_diff
+        super().__init__(device, frame_shape, frame_diff, frame_pack,
+                         torch.uint8 if self.normalize_on_gpu else torch.float32)
 
         self.agent_active, self.frame_buffer = agent_active, frame_buffer
+        self.frame_cache, self.frame_cache_data = frame_cache, OrderedDict()
+        self.render_skip = render_skip
         self.track_random_reset, self.track_random_reset_every = track_random_reset, track_random_reset_every
         self.track_cache, self.track_file, self.track_save = track_cache, track_file, track_save
 
@@ -147,8 +202,14 @@ class Racing(BaseEnv):
         os.environ['SDL_VIDEO_CENTERED'] = '1'
         os.environ['SDL_AUDIODRIVER'] = 'dsp'
 
-        # Initialize Pygame modules
-        pygame.init()
+        if self.frame_buffer:
+            # Headless, only the modules in use on the dummy video driver, no audio nor joystick, no events to handle
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            pygame.display.init()
+            pygame.font.init()
+        else:
+            # Initialize Pygame modules
+            pygame.init()
 
         if not self.frame_buffer:
             # Set the height and width of the screen
@@ -178,25 +239,35 @@ class Racing(BaseEnv):
             self.clock = pygame.time.Clock()
             self.prev_time = pygame.time.get_ticks()
 
+        # Snapshot buffer reused on every step, pinned for asynchronous copies to the device
+        pinned = self.device.type == 'cuda'
+        self.snapshot_frame = torch.empty((1, *self.frame_size), dtype = torch.uint8, pin_memory = pinned)
+        self.snapshot_event = torch.cuda.Event() if pinned else None
+
     def step(self, action = None, sync = False):
         """ Generate env states and params based on action """
 
         # Handle key events
         self.event_handler()
 
-        # Clear the screen and set the screen background
-        self.surface.fill(CLEAR_SCREEN)
+        # Action repeat, the agent action is applied render_skip times and the env is rendered once
+        reward = 0.0
+        for _ in range(self.render_skip if action is not None else 1):
+            # Environment act
+            if action is not None:
+                self.track.sprite.act_action(action)
 
-        # Environment act and render
-        if action is not None:
-            self.track.sprite.act_action(action)
+            self.track.act(self.attenuation)
+            position = self.track.sprite.get_position()
 
-        self.track.act(self.attenuation)
-        self.track.render(self.surface)
+            # Get current env params and accumulate the reward
+            params = self.track.get_params(position = position)
+            reward += rewarder(params)
 
-        if not self.frame_buffer:
-            # Update the screen
-            pygame.display.flip()
+            if not params["alive"]:
+                break
+
+        frame = self.render_frame(position)
 
         if not self.agent_active and sync:
             # Compute rendering time
@@ -206,56 +277,109 @@ class Racing(BaseEnv):
             # Handle constant FPS cap
             self.clock.tick(FPS_CAP)
 
-        # Create an image frame
-        rot = -(self.track.sprite.rotation / np.pi * 180)
-        center = self.track.sprite.get_position()
-        offset = np.array([self.frame_size[0] / 2 - 25, 0])
-
-        frame = create_snapshot(self.surface, size = self.frame_size, center = center, offset = offset, tensor = True,
-                                rotation = rot, grayscale = True, normalize = True)
-        frame = self.edit_frame(frame)
-
-        # Get current env params a reward
-        params = self.track.get_params()
-        reward = torch.tensor(rewarder(params)).to(self.device)
+        reward = torch.tensor(reward).to(self.device)
 
         # Check if it's done or not
         self.done = self.done or not params["alive"]
 
         return frame, reward, params
 
-    def event_handler(self):
-        # Event queue while window is active
-        if not self.frame_buffer:
+    def render_frame(self, position):
+        """ Render the env and create the state frame around the sprite """
+        # Look up a frame already rendered from a close pose
+        key, snapshot = None, None
+        if self.frame_cache:
+            key = self.get_frame_key()
+            snapshot = self.frame_cache_data.get(key)
+            if snapshot is not None:
+                self.frame_cache_data.move_to_end(key)
+
+        if snapshot is None or not self.frame_buffer:
+            # Clear the screen and set the screen background
+            self.surface.fill(CLEAR_SCREEN)
+
+            # Environment render
+            self.track.render(self.surface)
+
+            if not self.frame_buffer:
+                # Update the screen
+                pygame.display.flip()
+
+        if snapshot is None:
+            # Create an image frame
+            rot = -(self.track.sprite.rotation / np.pi * 180)
+            center = position
+            offset = np.array([self.frame_size[0] / 2 - 25, 0])
+
+            if self.snapshot_event is not None:
+                # Wait for the previous copy to be done reading the snapshot buffer
+                self.snapshot_event.synchronize()
+
+            snapshot = create_snapshot(self.surface, size = self.frame_size, center = center, offset = offset,
+                                       tensor = True, rotation = rot, grayscale = True, out_frame = self.snapshot_frame)
+
+            if key is not None:
+                # Keep the latest frames only
+                self.frame_cache_data[key] = snapshot.clone()
+                if len(self.frame_cache_data) > Racing.FRAME_CACHE_SIZE:
+                    self.frame_cache_data.popitem(last = False)
+
+        if self.normalize_on_gpu:
+            # Transfer the uint8 frame off the reused snapshot buffer, the agent model normalizes it
+            frame = snapshot.to(self.device, non_blocking = True, copy = True)
+        else:
+            # Transfer the uint8 frame, normalization happens afterwards on the device into a new tensor
+            frame = snapshot.to(self.device, non_blocking = True).float().mul_(1 / 255.)
 
-            if not self.agent_active:
-                # Continuous key press
-                keys = pygame.key.get_pressed()
+        if self.snapshot_event is not None:
+            self.snapshot_event.record()
 
-                if keys[pygame.K_UP]:
-                    self.track.sprite.movement(Sprite.acceleration * self.attenuation)
-                elif keys[pygame.K_DOWN]:
-                    self.track.sprite.movement(-Sprite.acceleration * self.attenuation)
+        return self.edit_frame(frame)
 
-                if keys[pygame.K_LEFT]:
-                    self.track.sprite.steer(Sprite.steering * self.attenuation)
-                elif keys[pygame.K_RIGHT]:
-                    self.track.sprite.steer(-Sprite.steering * self.attenuation)
+    def get_frame_key(self):
+        """ Quantized sprite pose, the only state the rendered frame depends on """
+        sprite = self.track.sprite
 
-            # User did something
-            for event in pygame.event.get():
-                # Close button is clicked
-                if event.type == pygame.QUIT:
-                    self.exit = True
+        return round(sprite.px / 2), round(sprite.py / 2), round(sprite.rotation * 20)
+
+    def event_handler(self):
+        # No window, neither key presses nor window events to handle
+        if self.frame_buffer:
+            return
 
-                # Escape key is pressed
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        self.exit = True
-                    elif event.key == pygame.K_PRINT:
-                        create_snapshot(self.surface, filename = "screen.png", save = True)
-                    elif event.key == pygame.K_r and not self.agent_active:
-                        self.track.reset_track()
+        if not self.agent_active:
+            # Continuous key press
+            keys = pygame.key.get_pressed()
+
+            if keys[pygame.K_UP]:
+                self.track.sprite.movement(Sprite.acceleration * self.attenuation)
+            elif keys[pygame.K_DOWN]:
+                self.track.sprite.movement(-Sprite.acceleration * self.attenuation)
+
+            if keys[pygame.K_LEFT]:
+                self.track.sprite.steer(Sprite.steering * self.attenuation)
+            elif keys[pygame.K_RIGHT]:
+                self.track.sprite.steer(-Sprite.steering * self.attenuation)
+        else:
+            # The agent is driving, the event queue is drained every few steps only
+            self.event_step += 1
+            if self.event_step % Racing.EVENT_PUMP_EVERY != 0:
+                return
+
+        # User did something
+        for event in pygame.event.get():
+            # Close button is clicked
+            if event.type == pygame.QUIT:
+                self.exit = True
+
+            # Escape key is pressed
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    self.exit = True
+                elif event.key == pygame.K_PRINT:
+                    create_snapshot(self.surface, filename = "screen.png", save = True)
+                elif event.key == pygame.K_r and not self.agent_active:
+                    self.track.reset_track()
 
     def reset(self, episode):
         super().reset(episode)
@@ -0,0 +1,28 @@
+import math
+
+from numba import njit, prange
+
+
+@njit(parallel = True, fastmath = True, cache = True)
+def snapshot_gray(src_u8, channels, x0, y0, pivot_x, pivot_y, cos, sin, dst, scale, bias):
+    """ Crop at (x0, y0) of the HxWxB surface view rotated around the pivot, nearest neighbour, into the grayscale
+    1xHxW frame as luminance * scale + bias; grid and source pixels outside of the surface are black """
+    height, width = src_u8.shape[0], src_u8.shape[1]
+
+    for y in prange(dst.shape[1]):
+        dy = y0 + y + 0.5 - pivot_y
+
+        for x in range(dst.shape[2]):
+            dx = x0 + x + 0.5 - pivot_x
+
+            # Source pixel, mapped back through the rotation
+            src_x = int(math.floor(cos * dx - sin * dy + pivot_x))
+            src_y = int(math.floor(sin * dx + cos * dy + pivot_y))
+
+            # Grid pixels past the surface are black, as the crop pads them
+            value = 0.
+            if x0 + x < width and y0 + y < height and 0 <= src_x < width and 0 <= src_y < height:
+                value = 0.299 * src_u8[src_y, src_x, channels[0]] + 0.587 * src_u8[src_y, src_x, channels[1]] + \
+                    0.114 * src_u8[src_y, src_x, channels[2]]
+
+            dst[0, y, x] = value * scale + bias
@@ -81,6 +81,10 @@ class Model(nn.Module):
 
     def forward(self, x, hidden_state):
         assert (len(x.shape) == 5)
+        if x.dtype == torch.uint8:
+            # Frames kept as uint8 are normalized on the model's device
+            x = x.float().mul_(1 / 255.)
+
         batch_size, seq_size = x.size(0), x.size(1)
 
         # BxSxCxHxW => BSxCxHxW
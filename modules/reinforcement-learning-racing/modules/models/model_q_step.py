@@ -55,6 +55,10 @@ class Model(nn.Module):
     def forward(self, x):
         batch_size = x.size(0)
 
+        if x.dtype == torch.uint8:
+            # Frames kept as uint8 are normalized on the model's device
+            x = x.float().mul_(1 / 255.)
+
         for sec in self.pipeline:
             x = sec.forward(x)
 
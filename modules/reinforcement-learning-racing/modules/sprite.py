@@ -1,3 +1,4 @@
+import math
 import pygame
 import numpy as np
 
@@ -12,6 +13,8 @@ class Sprite:
     MAX_VELOCITY: float = 2.15
     MIN_VELOCITY: float = 1.4
 
+    ROTATION_STEPS: int = 720
+
     ACTION_SPACE_COUNT = 2
     MOTION_SPACE_COUNT = 2
     STEERING_SPACE_COUNT = 2
@@ -27,19 +30,35 @@ class Sprite:
         "steering_amount": steering
     }
 
+    # Motion and steering amounts indexed by action
+    MOTION_TABLE: tuple = (acceleration, -acceleration, 0., 0., 0.)
+    STEERING_TABLE: tuple = (0., 0., steering, -steering, 0.)
+
+    # Fixed instance layout, faster attribute access on the hot loop state
+    __slots__ = ('px', 'py', 'ox', 'oy', 'csx', 'csy', 'rotation', 'velocity', 'params',
+                 'car_tex', 'car_size', 'car_rotations')
+
     def __init__(self, position, rotation, offset):
-        self.position = position
+        # Hot loop state kept as plain floats, position (px, py) and screen offset (ox, oy)
+        self.px, self.py = float(position[0]), float(position[1])
+        self.ox, self.oy = (float(offset), float(offset)) if np.isscalar(offset) else map(float, offset)
         self.rotation = rotation
-        self.offset = offset
         self.velocity = Sprite.MIN_VELOCITY
 
+        # Params shared between calls, only the dynamic entries are updated
+        self.params = { **Sprite.static_params, "pos": None, "acc": 0., "rot": 0. }
+
     def initialize(self):
         # Car texture
         self.car_tex = pygame.image.load("./assets/car.png")
         self.car_tex = pygame.transform.scale(self.car_tex, Sprite.SPRITE_SIZE)
         self.car_tex.set_colorkey(TRANSPARENT)
         self.car_size = np.array(self.car_tex.get_rect().size)
-        self.car_size_offset = self.car_size / 2
+        self.csx, self.csy = (float(size) / 2 for size in self.car_size)
+
+        # Car texture rotated around its center, quantized to ROTATION_STEPS angles
+        self.car_rotations = [ self.get_sprite_rotated(self.car_tex, index * 360. / Sprite.ROTATION_STEPS, (0, 0))
+                               for index in range(Sprite.ROTATION_STEPS) ]
 
     def steer(self, steering):
         self.rotation += steering
@@ -58,37 +77,35 @@ class Sprite:
             self.velocity = Sprite.MIN_VELOCITY
 
     def act(self, scaling = 1.0):
-        direction = np.array([np.cos(self.rotation), -np.sin(self.rotation)])
+        distance = self.velocity * scaling
 
-        self.position += direction * self.velocity * scaling
+        self.px += math.cos(self.rotation) * distance
+        self.py -= math.sin(self.rotation) * distance
 
     def act_action(self, action):
         """ action-4 do nothing """
         if action is None:
             return None
 
-        motion, steering = 0., 0.
-        if action == 0:
-            motion += Sprite.acceleration
+        action = int(action)
 
-        if action == 1:
-            motion -= Sprite.acceleration
-
-        if action == 2:
-            steering += Sprite.steering
-
-        if action == 3:
-            steering -= Sprite.steering
-
-        self.movement(motion)
-        self.steer(steering)
+        self.movement(Sprite.MOTION_TABLE[action])
+        self.steer(Sprite.STEERING_TABLE[action])
 
     def reset(self):
         self.velocity = Sprite.MIN_VELOCITY
         self.rotation = 0.
 
+    @property
+    def position(self):
+        return np.array([self.px, self.py])
+
+    @position.setter
+    def position(self, position):
+        self.px, self.py = float(position[0]), float(position[1])
+
     def get_position(self):
-        return self.position + self.offset
+        return np.array([self.px + self.ox, self.py + self.oy])
 
     def get_sprite_rotated(self, img, angle, offset):
         """ Rotate the image while keeping its center. """
@@ -100,20 +117,17 @@ class Sprite:
 
     def render(self, screen):
         # Get params
-        offset = self.position + self.offset - self.car_size_offset
-        rotation = 90 + self.rotation / np.pi * 180
+        rotation = math.degrees(self.rotation) + 90.
 
-        # Rotate an image from its center
-        surf, rect = self.get_sprite_rotated(self.car_tex, rotation, offset)
+        # Pick the cached image rotated from its center
+        surf, rect = self.car_rotations[int(round(rotation * Sprite.ROTATION_STEPS / 360.)) % Sprite.ROTATION_STEPS]
 
-        screen.blit(surf, rect)
+        screen.blit(surf, rect.move(self.px + self.ox - self.csx, self.py + self.oy - self.csy))
 
-    def get_params(self):
-        params = Sprite.static_params.copy()
-        params.update({
-            "pos": self.get_position(),
-            "acc": self.velocity,
-            "rot": self.rotation
-        })
+    def get_params(self, position = None):
+        """ The same dict is returned on every call, to be treated as read-only """
+        params = self.params
+        params["pos"] = position if position is not None else self.get_position()
+        params["acc"], params["rot"] = self.velocity, self.rotation
 
         return params
@@ -146,9 +146,10 @@ class Track:
         self.index, self.lap = self.start_index, 0
         self.progress, self.progress_max, self.progress_max_prev = 0, 0, 0
 
-    def is_to_left(self):
+    def is_to_left(self, position = None):
         """ Helper function for retrieving whenever the sprite is to the left of track from track perspective """
-        pos_origin, pos_track = self.sprite.get_position(), self.get_track_position(self.index)
+        pos_origin = position if position is not None else self.sprite.get_position()
+        pos_track = self.get_track_position(self.index)
         origin_angle, magnitude = point_angle(pos_origin, pos_track, invert = True)
         if origin_angle is None:
             return None
@@ -237,13 +238,16 @@ class Track:
     def get_progress(self):
         return self.lap * Track.TRACK_PRECISION + self.progress
 
-    def get_params(self, state = None, centered = False):
+    def get_params(self, state = None, centered = False, position = None):
+        if position is None:
+            position = self.sprite.get_position()
+
         params = Track.static_params.copy()
         params.update({
             "width": self.width,
             "index": self.index,
             "index_pos": self.get_track_position(self.index),
-            "is_to_left": self.is_to_left(),
+            "is_to_left": self.is_to_left(position),
             "start_index": self.start_index,
             "lap": self.lap,
             "progress": self.get_progress(),
@@ -253,7 +257,7 @@ class Track:
             "angle": self.get_metadata(self.index, offset = 5)[-1]
         })
 
-        params.update(self.sprite.get_params())
+        params.update(self.sprite.get_params(position))
 
         return params
 
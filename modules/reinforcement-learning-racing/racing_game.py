@@ -10,6 +10,7 @@ RACE_VERSION = 0.821
 def racing_game(args):
     # assert not (not args.agent_active and not args.agent_train), 'Live agent needs to be active'
     assert not (args.track_cache and args.track_save), 'The track is already cached locally'
+    assert args.render_skip > 0, 'Render skip needs to be positive'
 
     print(f'Running on {RACE_VERSION} ...')
 
@@ -34,7 +35,8 @@ def racing_game(args):
             envs.append(
                 Racing(device, args.frame_shape, args.agent_active, args.track_random_reset,
                        args.track_random_reset_every, args.frame_diff, args.frame_pack, args.frame_buffer,
-                       args.track_cache, args.track_cache_name, args.track_save))
+                       args.track_cache, args.track_cache_name, args.track_save, frame_cache = args.frame_cache,
+                       render_skip = args.render_skip))
 
     assert len(envs) > 0, 'Env model is invalid'
 